@@ -83,6 +83,16 @@ async def lifespan(app: FastAPI) -> AsyncIterator[None]:
         ]
     )
 
+    # Warm the tool routing table so the first chat request does not pay the
+    # tools/list round-trips. The preload must never block startup: if the MCP
+    # servers or the token endpoint are still coming up, log and continue —
+    # ensure_loaded retries lazily on the first chat request.
+    try:
+        tools = await tool_router.load()
+        logger.info("preloaded MCP tools", extra={"tool_count": len(tools)})
+    except Exception:
+        logger.warning("MCP tool preload failed; retrying on first request", exc_info=True)
+
     app.state.settings = settings
     app.state.http_client = http_client
     app.state.mcp_http_client = mcp_http_client
@@ -136,6 +136,7 @@ class ToolRouter:
         """Fetch ``tools/list`` from every client and build the routing table."""
         combined: list[ToolDefinition] = []
         name_to_client: dict[str, MCPClient] = {}
+        any_succeeded = False
 
         for client in self._clients:
             try:
@@ -143,6 +144,7 @@ class ToolRouter:
             except (MCPError, httpx.HTTPError) as exc:
                 logger.warning("tools/list failed for %s: %s", client.url, exc)
                 continue
+            any_succeeded = True
 
             for tool in tools:
                 if tool.name in name_to_client:
@@ -158,7 +160,10 @@ class ToolRouter:
 
         self._tools = combined
         self._name_to_client = name_to_client
-        self._loaded = True
+        # Only cache the table if at least one server answered; otherwise a
+        # startup preload against servers that are still coming up would pin
+        # an empty tool list for the life of the process.
+        self._loaded = any_succeeded
         return combined
 
     async def ensure_loaded(self) -> list[ToolDefinition]:
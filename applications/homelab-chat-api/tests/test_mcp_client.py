@@ -160,3 +160,51 @@ async def test_tool_router_routes_calls_to_correct_client() -> None:
 
         # list_plugs lookup hits client_b only for the tools/list call above.
         assert b_route.call_count == 1
+
+
+@pytest.mark.asyncio
+async def test_tool_router_retries_load_when_no_server_answered() -> None:
+    async with httpx.AsyncClient() as http_client, respx.mock() as mock:
+        mock.post(TOKEN_URL).mock(
+            return_value=httpx.Response(
+                200,
+                json={"access_token": "tok", "expires_in": 3600, "token_type": "bearer"},
+            )
+        )
+        mcp_route = mock.post(MCP_URL_A).mock(
+            side_effect=[
+                httpx.Response(503, text="starting up"),
+                httpx.Response(
+                    200,
+                    json={
+                        "jsonrpc": "2.0",
+                        "id": 1,
+                        "result": {
+                            "tools": [
+                                {
+                                    "name": "energy_latest",
+                                    "description": "",
+                                    "inputSchema": {},
+                                }
+                            ]
+                        },
+                    },
+                ),
+            ]
+        )
+
+        provider = await _token_provider(http_client)
+        client = MCPClient(url=MCP_URL_A, http_client=http_client, token_provider=provider)
+        router = ToolRouter([client])
+
+        # First load fails on every client, so the empty table is not cached.
+        assert await router.ensure_loaded() == []
+
+        # The next access retries tools/list and caches the recovered table.
+        tools = await router.ensure_loaded()
+        assert [t.name for t in tools] == ["energy_latest"]
+        assert mcp_route.call_count == 2
+
+        # Now that a server answered, further accesses serve the cache.
+        await router.ensure_loaded()
+        assert mcp_route.call_count == 2
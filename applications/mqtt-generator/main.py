@@ -7,14 +7,18 @@ Configurable for different value types (energy, temperature, etc.)
 with different intervals and ranges.
 """
 
+import heapq
 import os
+import socket
 import sys
+import threading
 import time
 import json
 import random
 import logging
 from datetime import datetime, timezone
 from typing import Dict, List, Any
+import orjson
 import paho.mqtt.client as mqtt
 
 # Configure logging
@@ -28,6 +32,12 @@ logger = logging.getLogger(__name__)
 class ValueGenerator:
     """Generates random values within a specified range."""
 
+    __slots__ = (
+        'name', 'min_val', 'max_val', 'decimals', 'accumulator',
+        'increment_min', 'increment_max', 'string_value', 'current_value',
+        '_random', '_span', '_increment_span',
+    )
+
     def __init__(self, name: str, min_val: float, max_val: float, decimals: int = 2, accumulator: bool = False, increment_min: float = 0, increment_max: float = 0, string_value: str = None):
         self.name = name
         self.min_val = min_val
@@ -39,6 +49,13 @@ class ValueGenerator:
         self.string_value = string_value
         self.current_value = min_val if accumulator else 0
 
+        # Bind a per-generator sampler once and precompute the range span, so
+        # generate() is a single multiply-add on a bound method instead of
+        # re-resolving random.uniform and its bounds on every call.
+        self._random = random.Random().random
+        self._span = max_val - min_val
+        self._increment_span = increment_max - increment_min
+
     def generate(self):
         """Generate a random value within the range."""
         if self.string_value is not None:
@@ -46,18 +63,18 @@ class ValueGenerator:
             return self.string_value
         elif self.accumulator:
             # For accumulators, increment the current value
-            increment = random.uniform(self.increment_min, self.increment_max)
-            self.current_value += increment
+            self.current_value += self.increment_min + self._increment_span * self._random()
             return round(self.current_value, self.decimals)
         else:
             # For regular values, generate random within range
-            value = random.uniform(self.min_val, self.max_val)
-            return round(value, self.decimals)
+            return round(self.min_val + self._span * self._random(), self.decimals)
 
 
 class DataStream:
     """Represents a data stream with topic, generators, and interval."""
 
+    __slots__ = ('topic', 'interval', 'generators')
+
     def __init__(self, config: Dict[str, Any]):
         self.topic = config['topic']
         self.interval = config['interval']
@@ -75,16 +92,10 @@ class DataStream:
                 string_value=gen_config.get('string_value', None)
             ))
 
-        self.last_publish = 0
-
-    def should_publish(self, current_time: float) -> bool:
-        """Check if it's time to publish based on interval."""
-        return current_time - self.last_publish >= self.interval
-
-    def generate_data(self) -> Dict[str, Any]:
-        """Generate data payload."""
+    def generate_data(self, timestamp: str) -> Dict[str, Any]:
+        """Generate data payload with the given ISO timestamp."""
         data = {
-            'timestamp': datetime.now(timezone.utc).isoformat(),
+            'timestamp': timestamp,
         }
 
         for generator in self.generators:
@@ -103,10 +114,6 @@ class DataStream:
 
         return data
 
-    def update_last_publish(self, current_time: float):
-        """Update the last publish time."""
-        self.last_publish = current_time
-
 
 class MQTTDataGenerator:
     """Main application class."""
@@ -119,11 +126,18 @@ class MQTTDataGenerator:
         # Parse configuration from environment
         self.streams = self._parse_config()
 
-        # MQTT client setup
-        self.client = mqtt.Client(client_id=self.mqtt_client_id)
+        # MQTT client setup (MQTT v5 with the current callback API)
+        self.client = mqtt.Client(
+            mqtt.CallbackAPIVersion.VERSION2,
+            client_id=self.mqtt_client_id,
+            protocol=mqtt.MQTTv5,
+        )
         self.client.on_connect = self._on_connect
         self.client.on_disconnect = self._on_disconnect
-        self.connected = False
+        self.client.on_socket_open = self._on_socket_open
+        # Set by the network-loop thread's on_connect callback; connect()
+        # blocks on it instead of polling a flag.
+        self.connected = threading.Event()
 
     def _parse_config(self) -> List[DataStream]:
         """Parse configuration from environment variables."""
@@ -158,19 +172,29 @@ class MQTTDataGenerator:
             logger.error(f"Failed to parse GENERATOR_CONFIG: {e}")
             sys.exit(1)
 
-    def _on_connect(self, client, userdata, flags, rc):
+    def _on_connect(self, client, userdata, flags, reason_code, properties):
         """Callback for when the client connects to the broker."""
-        if rc == 0:
-            self.connected = True
+        if not reason_code.is_failure:
+            self.connected.set()
             logger.info(f"Connected to MQTT broker at {self.mqtt_broker}:{self.mqtt_port}")
         else:
-            logger.error(f"Failed to connect to MQTT broker, return code {rc}")
+            logger.error(f"Failed to connect to MQTT broker: {reason_code}")
+
+    def _on_socket_open(self, client, userdata, sock):
+        """Disable Nagle's algorithm so small publish packets go out immediately.
 
-    def _on_disconnect(self, client, userdata, rc):
+        Registered on socket open (not connect) so it also applies after reconnects.
+        """
+        try:
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        except OSError as e:
+            logger.warning(f"Could not set TCP_NODELAY: {e}")
+
+    def _on_disconnect(self, client, userdata, flags, reason_code, properties):
         """Callback for when the client disconnects from the broker."""
-        self.connected = False
-        if rc != 0:
-            logger.warning(f"Unexpected disconnect from MQTT broker, return code {rc}")
+        self.connected.clear()
+        if reason_code.is_failure:
+            logger.warning(f"Unexpected disconnect from MQTT broker: {reason_code}")
         else:
             logger.info("Disconnected from MQTT broker")
 
@@ -181,13 +205,8 @@ class MQTTDataGenerator:
             self.client.connect(self.mqtt_broker, self.mqtt_port, 60)
             self.client.loop_start()
 
-            # Wait for connection
-            timeout = 10
-            start = time.time()
-            while not self.connected and time.time() - start < timeout:
-                time.sleep(0.1)
-
-            if not self.connected:
+            # Block until on_connect fires in the network-loop thread
+            if not self.connected.wait(timeout=10):
                 logger.error("Connection timeout")
                 sys.exit(1)
 
@@ -197,29 +216,50 @@ class MQTTDataGenerator:
 
     def run(self):
         """Main run loop."""
+        if not self.streams:
+            logger.error("No streams configured, nothing to publish")
+            self.client.loop_stop()
+            self.client.disconnect()
+            sys.exit(1)
+
         logger.info(f"Starting MQTT data generator with {len(self.streams)} streams")
         for stream in self.streams:
             logger.info(f"  - Topic: {stream.topic}, Interval: {stream.interval}s, Values: {[g.name for g in stream.generators]}")
 
+        # Min-heap of (next_publish_time, index, stream) so each iteration
+        # sleeps exactly until the earliest stream is due instead of waking
+        # every 100 ms to poll all streams. The index breaks ties between
+        # streams sharing the same interval.
+        now = time.time()
+        heap = [(now + stream.interval, index, stream) for index, stream in enumerate(self.streams)]
+        heapq.heapify(heap)
+
         try:
             while True:
-                current_time = time.time()
-
-                for stream in self.streams:
-                    if stream.should_publish(current_time):
-                        data = stream.generate_data()
-                        payload = json.dumps(data)
-
-                        result = self.client.publish(stream.topic, payload, qos=0)
-                        if result.rc == mqtt.MQTT_ERR_SUCCESS:
-                            logger.debug(f"Published to {stream.topic}: {payload}")
-                        else:
-                            logger.error(f"Failed to publish to {stream.topic}")
-
-                        stream.update_last_publish(current_time)
-
-                # Sleep a short time to avoid busy waiting
-                time.sleep(0.1)
+                delay = heap[0][0] - time.time()
+                if delay > 0:
+                    time.sleep(delay)
+
+                # Collect every stream that is due this tick, then publish the
+                # whole batch in one tight loop. Generating payloads first keeps
+                # the publish burst free of per-stream serialization work, so
+                # paho can flush the packets together.
+                now = time.time()
+                # One timestamp per tick: every stream published in this batch
+                # shares it, so isoformat() runs once instead of once per stream.
+                timestamp = datetime.now(timezone.utc).isoformat()
+                batch = []
+                while heap and heap[0][0] <= now:
+                    due, index, stream = heap[0]
+                    batch.append((stream.topic, orjson.dumps(stream.generate_data(timestamp))))
+                    heapq.heapreplace(heap, (due + stream.interval, index, stream))
+
+                for topic, payload in batch:
+                    result = self.client.publish(topic, payload, qos=0)
+                    if result.rc == mqtt.MQTT_ERR_SUCCESS:
+                        logger.debug(f"Published to {topic}: {payload}")
+                    else:
+                        logger.error(f"Failed to publish to {topic}")
 
         except KeyboardInterrupt:
             logger.info("Shutting down...")